@@ -1,27 +1,50 @@
 #!/usr/bin/env python3
 
 import argparse
+import ipaddress
 import json
 import logging
 import os
 import subprocess
 import sys
 import time
-from typing import Optional
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Optional
 
+import dns.rdataclass
+import dns.resolver
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
+# httpx logs every request at INFO; keep the output to our own messages.
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 CF_API = os.getenv("CF_API", "https://api.cloudflare.com/client/v4")
 RRTYPE = os.getenv("RRTYPE", "A")
 PROXIED = os.getenv("PROXIED", "false").lower() == "true"
 
 DNS_SERVER = os.getenv("DNS_SERVER", "1.1.1.1")
+OPENDNS_SERVER = "208.67.222.222"  # resolver1.opendns.com
+CLOUDFLARE_DNS_V6 = "2606:4700:4700::1111"
 CUSTOM_LOOKUP_CMD = os.getenv("CUSTOM_LOOKUP_CMD")
 
+CONFIG_DIR = "/config"
+CONFIG_FILE = f"{CONFIG_DIR}/cloudflare.conf"
+
+# Seconds a detected public IP is reused before probing again, and how long
+# update() trusts CF_LAST_IP before re-reading the record from Cloudflare.
+IP_CACHE_TTL = 30
+RECONCILE_INTERVAL = 3600
+
+_config: Optional[dict] = None
+_last_ip: Optional[str] = None
+_last_ip_ts = 0.0
+
 
 def load_from_file(file_path: Optional[str]) -> Optional[str]:
     if file_path and os.path.isfile(file_path):
@@ -35,6 +58,11 @@ ZONE = load_from_file(os.getenv("ZONE_FILE")) or os.getenv("ZONE")
 SUBDOMAIN = load_from_file(os.getenv("SUBDOMAIN_FILE")) or os.getenv("SUBDOMAIN")
 EMAIL = os.getenv("EMAIL")
 
+VERIFY_URL = f"{CF_API}/user" if EMAIL else f"{CF_API}/user/tokens/verify"
+ZONES_URL = f"{CF_API}/zones"
+RECORDS_URL = ZONES_URL + "/{zone_id}/dns_records"
+RECORD_URL = RECORDS_URL + "/{record_id}"
+
 
 def get_headers():
     headers: dict[str, str] = {"Content-Type": "application/json"}
@@ -46,42 +74,47 @@ def get_headers():
     return headers
 
 
-def api_call(method: str, url: str, data=None) -> dict:
-    headers = get_headers()
+# Credentials are fixed for the life of the process, so the auth headers are
+# built once and attached to the shared client. Reusing that client means
+# every Cloudflare API call shares one keep-alive HTTP/2 connection (with
+# concurrent calls multiplexed on it) instead of paying a fresh TCP + TLS
+# handshake.
+_HEADERS = get_headers()
+_CLIENT = httpx.Client(
+    http2=True,
+    headers=_HEADERS,
+    timeout=10,
+    limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+)
+
+
+def api_call(method: str, url: str, data=None, params=None) -> dict:
+    method = method.upper()
+    if method not in ("GET", "POST", "PATCH", "DELETE"):
+        raise ValueError(f"Unsupported method: {method}")
     try:
-        if method.upper() == "GET":
-            resp = requests.get(url, headers=headers, timeout=10)
-        elif method.upper() == "POST":
-            resp = requests.post(url, headers=headers, json=data, timeout=10)
-        elif method.upper() == "PATCH":
-            resp = requests.patch(url, headers=headers, json=data, timeout=10)
-        elif method.upper() == "DELETE":
-            resp = requests.delete(url, headers=headers, timeout=10)
-        else:
-            raise ValueError(f"Unsupported method: {method}")
+        resp = _CLIENT.request(method, url, params=params, json=data)
         resp.raise_for_status()
         return resp.json()
-    except requests.RequestException as e:
+    except (httpx.HTTPError, ValueError) as e:
         logging.error(f"API call failed: {e}")
         return {}
 
 
 def verify_token() -> bool:
-    url = f"{CF_API}/user/tokens/verify" if not EMAIL else f"{CF_API}/user"
-    resp = api_call("GET", url)
+    resp = api_call("GET", VERIFY_URL)
     return resp.get("success", False)
 
 
 def get_zone_id(zone: str) -> Optional[str]:
-    url = f"{CF_API}/zones?name={zone}"
-    resp = api_call("GET", url)
+    resp = api_call("GET", ZONES_URL, params={"name": zone})
     zones = resp.get("result", [])
     return zones[0]["id"] if zones else None
 
 
 def get_dns_record_id(zone_id: str, name: str, rrtype: str) -> Optional[str]:
-    url = f"{CF_API}/zones/{zone_id}/dns_records?type={rrtype}&name={name}"
-    resp = api_call("GET", url)
+    url = RECORDS_URL.format(zone_id=zone_id)
+    resp = api_call("GET", url, params={"type": rrtype, "name": name})
     records = resp.get("result", [])
     return records[0]["id"] if records else None
 
@@ -96,7 +129,7 @@ def create_dns_record(
         "proxied": proxied,
         "ttl": 1,
     }
-    url = f"{CF_API}/zones/{zone_id}/dns_records"
+    url = RECORDS_URL.format(zone_id=zone_id)
     resp = api_call("POST", url, data)
     return resp.get("result", {}).get("id")
 
@@ -105,124 +138,184 @@ def update_dns_record(
     zone_id: str, record_id: str, name: str, content: str, rrtype: str, proxied: bool
 ) -> bool:
     data = {"type": rrtype, "name": name, "content": content, "proxied": proxied}
-    url = f"{CF_API}/zones/{zone_id}/dns_records/{record_id}"
+    url = RECORD_URL.format(zone_id=zone_id, record_id=record_id)
     resp = api_call("PATCH", url, data)
     return resp.get("success", False)
 
 
 def delete_dns_record(zone_id: str, record_id: str) -> bool:
-    url = f"{CF_API}/zones/{zone_id}/dns_records/{record_id}"
+    url = RECORD_URL.format(zone_id=zone_id, record_id=record_id)
     resp = api_call("DELETE", url)
     return resp.get("success", False)
 
 
 def get_dns_record_ip(zone_id: str, record_id: str) -> Optional[str]:
-    url = f"{CF_API}/zones/{zone_id}/dns_records/{record_id}"
+    url = RECORD_URL.format(zone_id=zone_id, record_id=record_id)
     resp = api_call("GET", url)
     return resp.get("result", {}).get("content")
 
 
+# Public IP probes hit unrelated hosts, so they get their own session rather
+# than sharing the Cloudflare one (and its auth headers). One pool per
+# service keeps each connection alive between update() runs.
+_PROBE_SESSION = requests.Session()
+_PROBE_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=6,
+        pool_maxsize=6,
+        max_retries=Retry(total=2, connect=2, read=0, backoff_factor=0.2),
+    ),
+)
+
+PROBE_WORKERS = 4
+PROBE_STAGGER = 0.15
+# (connect, read) per attempt. The adapter retries only failed connects, so a
+# silent host costs one read timeout rather than several.
+PROBE_TIMEOUT = (1.0, 2.0)
+
+Probe = tuple[str, Callable[[], Optional[str]]]
+
+
+def _is_ip(value, rrtype: str) -> bool:
+    if not isinstance(value, str):
+        return False
+    address_type = ipaddress.IPv4Address if rrtype == "A" else ipaddress.IPv6Address
+    try:
+        address_type(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _race_probes(probes: list[Probe], rrtype: str) -> Optional[str]:
+    """Run probes concurrently and return the first valid IP for rrtype.
+
+    Probes start PROBE_STAGGER seconds apart (or as soon as the previous one
+    fails), so a healthy primary still wins while a hung one no longer holds
+    up the rest of the list.
+    """
+    queue = list(probes)
+    pending: dict[Future, str] = {}
+    executor = ThreadPoolExecutor(max_workers=PROBE_WORKERS)
+    try:
+        while queue or pending:
+            timeout = None
+            if queue:
+                label, probe = queue.pop(0)
+                logging.info(f"Trying {label}")
+                pending[executor.submit(probe)] = label
+                if queue:
+                    timeout = PROBE_STAGGER
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                label = pending.pop(future)
+                try:
+                    ip = future.result()
+                except Exception as e:
+                    logging.warning(f"{label} failed: {e}")
+                    continue
+                if _is_ip(ip, rrtype):
+                    logging.info(f"Got IP from {label}: {ip}")
+                    return ip
+                logging.warning(f"{label} returned no valid IP: {ip!r}")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return None
+
+
+def _resolver(nameserver: str) -> dns.resolver.Resolver:
+    # 1 s per attempt, retried until the 2 s lifetime runs out.
+    resolver = dns.resolver.Resolver(configure=False)
+    resolver.nameservers = [nameserver]
+    resolver.timeout = 1.0
+    resolver.lifetime = 2.0
+    return resolver
+
+
+_OPENDNS_RESOLVER = _resolver(OPENDNS_SERVER)
+_CLOUDFLARE_V6_RESOLVER = _resolver(CLOUDFLARE_DNS_V6)
+
+
+def _whoami_cloudflare(resolver: dns.resolver.Resolver) -> Optional[str]:
+    answer = resolver.resolve("whoami.cloudflare", "TXT", rdclass=dns.rdataclass.CH)
+    return answer[0].to_text().strip('"') or None
+
+
+def _cloudflare_dns_v4() -> Optional[str]:
+    # DNS_SERVER is user-supplied and may not be an IP literal, so build its
+    # resolver here: a bad value then fails this probe instead of the import.
+    return _whoami_cloudflare(_resolver(DNS_SERVER))
+
+
+def _opendns_v4() -> Optional[str]:
+    answer = _OPENDNS_RESOLVER.resolve("myip.opendns.com", "A")
+    return answer[0].to_text()
+
+
+def _cloudflare_dns_v6() -> Optional[str]:
+    return _whoami_cloudflare(_CLOUDFLARE_V6_RESOLVER)
+
+
+def _http_probe(url: str, extractor: Callable[[requests.Response], Optional[str]]):
+    def probe() -> Optional[str]:
+        resp = _PROBE_SESSION.get(url, timeout=PROBE_TIMEOUT)
+        resp.raise_for_status()
+        return extractor(resp)
+
+    return (f"HTTP fallback {url}", probe)
+
+
+def _text_ip(resp: requests.Response) -> Optional[str]:
+    return resp.text.strip()
+
+
+def _json_ip(resp: requests.Response) -> Optional[str]:
+    return resp.json().get("ip")
+
+
+def _json_origin(resp: requests.Response) -> Optional[str]:
+    return resp.json().get("origin")
+
+
+_DNS_V4_PROBES: tuple[Probe, ...] = (
+    ("Cloudflare DNS for IPv4", _cloudflare_dns_v4),
+    ("OpenDNS for IPv4", _opendns_v4),
+)
+_DNS_V6_PROBES: tuple[Probe, ...] = (("Cloudflare DNS for IPv6", _cloudflare_dns_v6),)
+
+_HTTP_V4_SERVICES = (
+    ("https://ipinfo.io", _json_ip),
+    ("https://api.ipify.org", _text_ip),
+    ("https://icanhazip.com", _text_ip),
+    ("https://checkip.amazonaws.com", _text_ip),
+    ("https://httpbin.org/ip", _json_origin),
+    ("https://api.myip.com", _json_ip),
+)
+_HTTP_V6_SERVICES = (
+    ("https://ifconfig.co", _text_ip),
+    ("https://api6.ipify.org", _text_ip),
+    ("https://icanhazip.com", _text_ip),
+    ("https://checkip.amazonaws.com", _text_ip),
+    ("https://httpbin.org/ip", _json_origin),
+    ("https://api.myip.com", _json_ip),
+)
+
+
 def get_public_ip(rrtype: str) -> Optional[str]:
     if rrtype == "A":
-        # Try Cloudflare DNS
-        logging.info("Trying Cloudflare DNS for IPv4")
-        try:
-            result = subprocess.run(
-                ["dig", "+short", f"@{DNS_SERVER}", "ch", "txt", "whoami.cloudflare"],
-                capture_output=True,
-                text=True,
-                timeout=5,
-            )
-            ip = result.stdout.strip().strip('"')
-            if ip and len(ip) <= 15:  # IPv4 length
-                logging.info(f"Got IP from Cloudflare DNS: {ip}")
-                return ip
-        except Exception as e:
-            logging.warning(f"Cloudflare DNS failed: {e}")
-        # Fallback to OpenDNS
-        logging.info("Trying OpenDNS for IPv4")
-        try:
-            result = subprocess.run(
-                ["dig", "+short", "myip.opendns.com", "@resolver1.opendns.com"],
-                capture_output=True,
-                text=True,
-                timeout=5,
-            )
-            ip = result.stdout.strip()
-            if ip:
-                logging.info(f"Got IP from OpenDNS: {ip}")
-                return ip
-        except Exception as e:
-            logging.warning(f"OpenDNS failed: {e}")
-        # HTTP fallbacks
-        http_services = [
-            ("https://ipinfo.io", lambda resp: resp.json().get("ip")),
-            ("https://api.ipify.org", lambda resp: resp.text.strip()),
-            ("https://icanhazip.com", lambda resp: resp.text.strip()),
-            ("https://checkip.amazonaws.com", lambda resp: resp.text.strip()),
-            ("https://httpbin.org/ip", lambda resp: resp.json().get("origin")),
-            ("https://api.myip.com", lambda resp: resp.json().get("ip")),
-        ]
-        for url, extractor in http_services:
-            logging.info(f"Trying HTTP fallback: {url}")
-            try:
-                resp = requests.get(url, timeout=5)
-                resp.raise_for_status()
-                ip = extractor(resp)
-                if ip:
-                    logging.info(f"Got IP from {url}: {ip}")
-                    return ip
-            except Exception as e:
-                logging.warning(f"HTTP fallback {url} failed: {e}")
-        logging.error("All IPv4 IP detection methods failed")
-        return None
+        family, dns_probes, http_services = "IPv4", _DNS_V4_PROBES, _HTTP_V4_SERVICES
     elif rrtype == "AAAA":
-        # IPv6
-        logging.info("Trying Cloudflare DNS for IPv6")
-        try:
-            result = subprocess.run(
-                [
-                    "dig",
-                    "+short",
-                    "@2606:4700:4700::1111",
-                    "-6",
-                    "ch",
-                    "txt",
-                    "whoami.cloudflare",
-                ],
-                capture_output=True,
-                text=True,
-                timeout=5,
-            )
-            ip = result.stdout.strip().strip('"')
-            if ip:
-                logging.info(f"Got IPv6 from Cloudflare DNS: {ip}")
-                return ip
-        except Exception as e:
-            logging.warning(f"Cloudflare IPv6 DNS failed: {e}")
-        # HTTP fallbacks
-        http_services = [
-            ("https://ifconfig.co", lambda resp: resp.text.strip()),
-            ("https://api6.ipify.org", lambda resp: resp.text.strip()),
-            ("https://icanhazip.com", lambda resp: resp.text.strip()),
-            ("https://checkip.amazonaws.com", lambda resp: resp.text.strip()),
-            ("https://httpbin.org/ip", lambda resp: resp.json().get("origin")),
-            ("https://api.myip.com", lambda resp: resp.json().get("ip")),
-        ]
-        for url, extractor in http_services:
-            logging.info(f"Trying HTTP fallback: {url}")
-            try:
-                resp = requests.get(url, timeout=5)
-                resp.raise_for_status()
-                ip = extractor(resp)
-                if ip:
-                    logging.info(f"Got IPv6 from {url}: {ip}")
-                    return ip
-            except Exception as e:
-                logging.warning(f"HTTP fallback {url} failed: {e}")
-        logging.error("All IPv6 IP detection methods failed")
+        family, dns_probes, http_services = "IPv6", _DNS_V6_PROBES, _HTTP_V6_SERVICES
+    else:
         return None
-    return None
+    # DNS and HTTP probes are independent, so they share one race: a slow DNS
+    # server no longer has to time out before the HTTP fallbacks start.
+    probes = [*dns_probes, *(_http_probe(url, ex) for url, ex in http_services)]
+    ip = _race_probes(probes, rrtype)
+    if not ip:
+        logging.error(f"All {family} IP detection methods failed")
+    return ip
 
 
 def get_custom_ip(cmd: str) -> Optional[str]:
@@ -242,13 +335,37 @@ def get_custom_ip(cmd: str) -> Optional[str]:
     return None
 
 
+def load_config() -> Optional[dict]:
+    # This process is the only writer, so the file is read at most once.
+    global _config
+    if _config is None:
+        if not os.path.exists(CONFIG_FILE):
+            return None
+        with open(CONFIG_FILE, "r") as f:
+            _config = json.load(f)
+    return _config
+
+
+def save_config(config: dict) -> None:
+    global _config
+    os.makedirs(CONFIG_DIR, exist_ok=True)
+    with open(CONFIG_FILE, "w") as f:
+        json.dump(config, f)
+    _config = config
+
+
 def get_current_ip() -> Optional[str]:
+    global _last_ip, _last_ip_ts
+    if _last_ip and time.monotonic() - _last_ip_ts < IP_CACHE_TTL:
+        return _last_ip
     if CUSTOM_LOOKUP_CMD:
         ip = get_custom_ip(CUSTOM_LOOKUP_CMD)
     else:
         ip = get_public_ip(RRTYPE)
     if not ip:
         logging.error("Failed to get current IP")
+        return None
+    _last_ip, _last_ip_ts = ip, time.monotonic()
     return ip
 
 
@@ -262,7 +379,15 @@ def setup():
         logging.error("API_KEY and ZONE are required")
         sys.exit(1)
 
-    if not verify_token():
+    # Detecting the public IP and opening the Cloudflare connection are
+    # independent and both can be slow, so let them overlap.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        ip_future = executor.submit(get_current_ip)
+        token_future = executor.submit(verify_token)
+        token_valid = token_future.result()
+        current_ip = ip_future.result()
+
+    if not token_valid:
         logging.error("Invalid Cloudflare credentials")
         sys.exit(1)
 
@@ -273,61 +398,95 @@ def setup():
 
     logging.info(f"DNS Zone: {ZONE} ({zone_id})")
 
-    current_ip = get_current_ip()
     if not current_ip:
         logging.error("Failed to get current IP")
         sys.exit(1)
 
     dns_name = get_dns_name()
-    record_id = get_dns_record_id(zone_id, dns_name, RRTYPE)
-
-    if not record_id:
-        logging.info(f"Creating DNS record for {dns_name}")
-        record_id = create_dns_record(zone_id, dns_name, current_ip, RRTYPE, PROXIED)
-        if not record_id:
-            logging.error(f"Failed to create DNS record for {dns_name}")
-            sys.exit(1)
-
-    logging.info(f"DNS Record: {dns_name} ({record_id})")
-
     config = {
         "CF_ZONE_ID": zone_id,
-        "CF_RECORD_ID": record_id,
         "CF_RECORD_NAME": dns_name,
+        "CF_RECORD_TYPE": RRTYPE,
     }
-    os.makedirs("/config", exist_ok=True)
-    with open("/config/cloudflare.conf", "w") as f:
-        json.dump(config, f)
+    previous = load_config() or {}
+    cached_id = previous.get("CF_RECORD_ID")
+
+    # If a previous run already found the record, push the current IP to it
+    # directly: a successful PATCH proves the record still exists and saves
+    # the lookup. Otherwise fall back to looking it up (or creating it).
+    if (
+        cached_id
+        and all(previous.get(key) == config[key] for key in config)
+        and update_dns_record(zone_id, cached_id, dns_name, current_ip, RRTYPE, PROXIED)
+    ):
+        record_id = cached_id
+        config["CF_LAST_IP"] = current_ip
+        config["CF_LAST_CHECK"] = time.time()
+    else:
+        record_id = get_dns_record_id(zone_id, dns_name, RRTYPE)
+        if record_id:
+            if record_id == cached_id:
+                for key in ("CF_LAST_IP", "CF_LAST_CHECK"):
+                    if key in previous:
+                        config[key] = previous[key]
+        else:
+            logging.info(f"Creating DNS record for {dns_name}")
+            record_id = create_dns_record(
+                zone_id, dns_name, current_ip, RRTYPE, PROXIED
+            )
+            if not record_id:
+                logging.error(f"Failed to create DNS record for {dns_name}")
+                sys.exit(1)
+            config["CF_LAST_IP"] = current_ip
+            config["CF_LAST_CHECK"] = time.time()
+
+    logging.info(f"DNS Record: {dns_name} ({record_id})")
+    config["CF_RECORD_ID"] = record_id
+    save_config(config)
 
 
 def update():
-    if not os.path.exists("/config/cloudflare.conf"):
+    config = load_config()
+    if config is None:
         logging.error("Config file not found")
         return
 
-    with open("/config/cloudflare.conf", "r") as f:
-        config = json.load(f)
-
     zone_id = config["CF_ZONE_ID"]
     record_id = config["CF_RECORD_ID"]
     dns_name = config["CF_RECORD_NAME"]
 
-    dns_ip = get_dns_record_ip(zone_id, record_id)
     current_ip = get_current_ip()
-
     if not current_ip:
         logging.error("Failed to get current IP")
         return
 
+    # Trust the last IP we pushed and skip Cloudflare entirely, but still
+    # check the record once in a while in case it was edited elsewhere. Both
+    # are kept in the config file so one-shot `update` runs benefit too.
+    last_check = config.get("CF_LAST_CHECK", 0)
+    if (
+        current_ip == config.get("CF_LAST_IP")
+        and time.time() - last_check < RECONCILE_INTERVAL
+    ):
+        logging.info(f"No update needed for {dns_name} ({current_ip})")
+        return
+
+    dns_ip = get_dns_record_ip(zone_id, record_id)
+
     if current_ip != dns_ip:
         logging.info(f"Updating DNS record {dns_name} from {dns_ip} to {current_ip}")
         if update_dns_record(zone_id, record_id, dns_name, current_ip, RRTYPE, PROXIED):
             logging.info(f"DNS record updated successfully")
         else:
             logging.error("Failed to update DNS record")
+            return
     else:
         logging.info(f"No update needed for {dns_name} ({dns_ip})")
 
+    config["CF_LAST_IP"] = current_ip
+    config["CF_LAST_CHECK"] = time.time()
+    save_config(config)
+
 
 def run():
     setup()
@@ -335,8 +494,13 @@ def run():
 
     schedule.every(5).minutes.do(update)
     while True:
+        # Sleep exactly until the next job is due instead of polling.
+        idle = schedule.idle_seconds()
+        if idle is None:
+            break
+        if idle > 0:
+            time.sleep(idle)
         schedule.run_pending()
-        time.sleep(60)
 
 
 def main():